@@ -0,0 +1,40 @@
+"""
+Benchmarks nested attribute reads (cfg.a.b.c) on AttrDict and
+FrozenAttrDict, against the AttrDict that copied nested dicts on
+every access.
+
+    python benchmarks/bench_attrdict.py
+"""
+
+import timeit
+
+from deeputil import AttrDict, FrozenAttrDict
+
+
+class CopyingAttrDict(dict):
+    def __getitem__(self, name):
+        item = super(CopyingAttrDict, self).__getitem__(name)
+
+        return CopyingAttrDict(item) if isinstance(item, dict) else item
+
+    __getattr__ = __getitem__
+
+
+CONFIG = {"a": {"b": {"c": 1, "pad": list(range(10))}, "x": dict.fromkeys("xyz")}}
+
+
+def main(number=200000):
+    plain = CONFIG
+    cases = [
+        ("dict (cfg['a']['b']['c'])", lambda: plain["a"]["b"]["c"]),
+        ("AttrDict, copying", (lambda cfg: lambda: cfg.a.b.c)(CopyingAttrDict(CONFIG))),
+        ("AttrDict", (lambda cfg: lambda: cfg.a.b.c)(AttrDict(CONFIG))),
+        ("FrozenAttrDict", (lambda cfg: lambda: cfg.a.b.c)(FrozenAttrDict(CONFIG))),
+    ]
+    for name, fn in cases:
+        t = timeit.timeit(fn, number=number) / number
+        print("%-30s %8.1f ns/read" % (name, t * 1e9))
+
+
+if __name__ == "__main__":
+    main()
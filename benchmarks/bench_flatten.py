@@ -0,0 +1,84 @@
+"""
+Benchmarks flatten_dict and serialize_dict_keys on wide and deep
+documents, against the recursive implementation they replaced.
+
+    python benchmarks/bench_flatten.py
+"""
+
+import timeit
+
+from deeputil.misc import MarkValue, Mapping, flatten_dict, serialize_dict_keys
+
+
+def recursive_flatten_dict(d, parent_key="", sep="."):
+    items = {}
+    for k in d:
+        if k.startswith("__"):
+            continue
+        v = d[k]
+        if k.startswith("_") and not k.startswith("__"):
+            v = MarkValue(repr(v))
+
+        new_key = sep.join((parent_key, k)) if parent_key else k
+        if isinstance(v, Mapping):
+            items.update(recursive_flatten_dict(v, new_key, sep=sep))
+        else:
+            items[new_key] = v
+
+    return items
+
+
+def recursive_serialize_dict_keys(d, prefix=""):
+    keys = []
+    for k, v in d.items():
+        fqk = "{}{}".format(prefix, k)
+        keys.append(fqk)
+        if isinstance(v, dict):
+            keys.extend(recursive_serialize_dict_keys(v, prefix="{}.".format(fqk)))
+
+    return keys
+
+
+def wide_doc(width=50, depth=3):
+    if depth == 0:
+        return 1
+    return {"k%d" % i: wide_doc(width // 2 or 1, depth - 1) for i in range(width)}
+
+
+def deep_doc(depth):
+    doc = {"leaf": 1}
+    for i in range(depth):
+        doc = {"k%d" % i: doc, "v": i}
+    return doc
+
+
+def bench(name, fn, doc, number):
+    try:
+        t = timeit.timeit(lambda: fn(doc), number=number) / number
+    except RecursionError:
+        print("%-40s RecursionError" % name)
+        return
+    print("%-40s %10.1f us" % (name, t * 1e6))
+
+
+def main():
+    docs = [
+        ("wide (50x25x12)", wide_doc(), 200),
+        ("deep (depth 200)", deep_doc(200), 200),
+        ("deep (depth 5000)", deep_doc(5000), 5),
+    ]
+    for label, doc, number in docs:
+        print(label)
+        bench("  flatten_dict", flatten_dict, doc, number)
+        bench("  flatten_dict (recursive)", recursive_flatten_dict, doc, number)
+        bench("  serialize_dict_keys", serialize_dict_keys, doc, number)
+        bench(
+            "  serialize_dict_keys (recursive)",
+            recursive_serialize_dict_keys,
+            doc,
+            number,
+        )
+
+
+if __name__ == "__main__":
+    main()
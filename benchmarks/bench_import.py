@@ -0,0 +1,106 @@
+"""
+Measures how long `import deeputil` and a few typical first uses take,
+using `python -X importtime`, and checks that heavy dependencies are
+only loaded by the helpers that need them.
+
+Exits with status 1 when a case goes over its budget or loads a module
+it should not, so it can run as a regression check.
+
+    python benchmarks/bench_import.py [--runs 7] [--scale 1.0]
+"""
+
+import os
+import sys
+import argparse
+import statistics
+import subprocess
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+HEAVY = ("asyncio", "concurrent.futures", "repoze.lru", "inspect", "numpy")
+
+# (label, statement, budget in ms, heavy modules it may load)
+CASES = [
+    ("import deeputil", "import deeputil", 5, ()),
+    ("deeputil.AttrDict", "import deeputil; deeputil.AttrDict", 40, ()),
+    ("deeputil.FunctionTimer", "import deeputil; deeputil.FunctionTimer", 10, ()),
+    (
+        "deeputil.ExpiringCache",
+        "import deeputil; deeputil.ExpiringCache",
+        60,
+        ("repoze.lru",),
+    ),
+    ("from deeputil import *", "from deeputil import *", 80, ("repoze.lru",)),
+]
+
+
+def import_time(stmt):
+    """
+    Runs @stmt in a fresh interpreter, returns the time spent importing
+    in ms and the modules it loaded
+    """
+    code = "%s\nimport sys\nprint(' '.join(sys.modules))" % stmt
+    env = dict(os.environ, PYTHONPATH=ROOT)
+    p = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", code],
+        env=env,
+        capture_output=True,
+        text=True,
+        check=True,
+    )
+
+    # Top level imports done by the interpreter start up come before
+    # `site`; the ones after it are ours
+    total, ours = 0, False
+    for line in p.stderr.splitlines():
+        if not line.startswith("import time:") or "|" not in line:
+            continue
+        _, cumulative, name = line.split("|")
+        if name.startswith("  "):
+            continue
+        name = name.strip()
+        if name == "site":
+            ours = True
+            continue
+        if ours:
+            total += int(cumulative)
+
+    return total / 1000.0, set(p.stdout.split())
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--runs", type=int, default=7)
+    parser.add_argument(
+        "--scale", type=float, default=1.0, help="multiply every budget, for slow CI"
+    )
+    args = parser.parse_args()
+
+    failed = False
+    for label, stmt, budget, allowed in CASES:
+        times = []
+        for _ in range(args.runs):
+            t, modules = import_time(stmt)
+            times.append(t)
+
+        median = statistics.median(times)
+        budget *= args.scale
+        heavy = sorted(m for m in HEAVY if m in modules and m not in allowed)
+
+        problems = []
+        if median > budget:
+            problems.append("over budget of %.0f ms" % budget)
+        if heavy:
+            problems.append("loads %s" % ", ".join(heavy))
+        failed = failed or bool(problems)
+
+        print(
+            "%-28s %8.2f ms  %s"
+            % (label, median, "; ".join(problems) if problems else "ok")
+        )
+
+    sys.exit(1 if failed else 0)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,44 @@
+"""
+Benchmarks making random IDs one generate_random_string call at a
+time against generate_random_strings and the buffered RandomStrings.
+
+    python benchmarks/bench_random.py
+"""
+
+import timeit
+
+from deeputil.misc import (
+    RandomStrings,
+    generate_random_string,
+    generate_random_strings,
+)
+
+N = 100000
+
+
+def bench(name, fn, number=5):
+    t = min(timeit.repeat(fn, number=1, repeat=number)) / N
+    print("%-44s %8.3f us/id" % (name, t * 1e6))
+
+
+def main():
+    for length in (12, 32):
+        print("length %d" % length)
+        bench(
+            "  generate_random_string",
+            lambda: [generate_random_string(length) for _ in range(N)],
+        )
+        for alphabet in ("hex", "base32", "base62"):
+            bench(
+                "  generate_random_strings (%s)" % alphabet,
+                lambda: generate_random_strings(N, length, alphabet),
+            )
+            ids = RandomStrings(length, alphabet)
+            bench(
+                "  RandomStrings (%s), one next() per id" % alphabet,
+                lambda: [next(ids) for _ in range(N)],
+            )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,370 @@
+"""
+Benchmarks deeputil's data structures and helpers on reproducible
+workloads: Zipfian key streams, update-heavy heaps, deep nested dicts
+and large streamed payloads.
+
+For every case it reports the throughput, the p50/p95/p99 latency per
+operation (measured over batches of operations) and the peak memory
+allocated while running, traced with tracemalloc in a separate pass so
+that tracing does not slow down the timed runs.
+
+Results can be saved as a baseline and later runs compared against it.
+A case regresses when its throughput drops, or its peak memory grows,
+by more than --threshold; the run then exits with status 1.
+
+    python benchmarks/bench_suite.py --save baseline.json
+    python benchmarks/bench_suite.py --compare baseline.json [--threshold 0.2]
+    python benchmarks/bench_suite.py --only cache,memoize --scale 0.1
+
+Baselines are only comparable on the same machine and Python.
+"""
+
+import sys
+import json
+import time
+import random
+import argparse
+import platform
+import itertools
+import functools
+import statistics
+import tracemalloc
+
+from deeputil import (
+    AttrDict,
+    ExpiringCache,
+    ExpiringCounter,
+    IterAsFile,
+    PriorityDict,
+    memoize,
+)
+from deeputil.streamcounter import DecayedStreamCounter, StreamCounter
+
+# name: (make, number of operations at scale 1, operations per timed batch)
+CASES = {}
+
+# Growth in peak memory below this is noise, whatever the threshold
+MIN_MEMORY_DELTA = 64 * 1024
+
+
+def case(name, n, batch=100):
+    """
+    Registers make(rng, n), which builds the workload and returns
+    run(lo, hi) doing operations lo to hi of it
+    """
+
+    def register(make):
+        CASES[name] = (make, n, batch)
+        return make
+
+    return register
+
+
+def zipf_keys(rng, n, n_keys, s=1.1):
+    """
+    @n keys out of @n_keys, the k-th most frequent one drawn with
+    a probability proportional to 1 / k ** @s
+    """
+    weights = [1.0 / k**s for k in range(1, n_keys + 1)]
+    names = ["key-%d" % k for k in range(n_keys)]
+    rng.shuffle(names)
+    return rng.choices(names, weights=weights, k=n)
+
+
+def nested_dict(rng, depth, fanout):
+    if depth == 0:
+        return rng.random()
+    return {"k%d" % i: nested_dict(rng, depth - 1, fanout) for i in range(fanout)}
+
+
+@case("priority_dict.update", n=200000)
+def priority_dict_update(rng, n):
+    # Mostly priority updates of hot keys, with one pop in eight
+    keys = zipf_keys(rng, n, 20000)
+    priorities = [rng.random() for _ in range(n)]
+    d = PriorityDict()
+
+    def run(lo, hi):
+        for i in range(lo, hi):
+            d[keys[i]] = priorities[i]
+            if not i & 7:
+                d.pop_smallest()
+
+    return run
+
+
+@case("stream_counter.add", n=200000)
+def stream_counter_add(rng, n):
+    keys = zipf_keys(rng, n, 100000)
+    s = StreamCounter(chunk_size=10000, max_counts=20000)
+
+    def run(lo, hi):
+        add = s.add
+        for i in range(lo, hi):
+            add(keys[i])
+
+    return run
+
+
+@case("decayed_stream_counter.add", n=200000)
+def decayed_stream_counter_add(rng, n):
+    keys = zipf_keys(rng, n, 100000)
+    s = DecayedStreamCounter(half_life=10000, max_counts=20000)
+
+    def run(lo, hi):
+        add = s.add
+        for i in range(lo, hi):
+            add(keys[i])
+
+    return run
+
+
+@case("expiring_counter.put", n=100000)
+def expiring_counter_put(rng, n):
+    keys = zipf_keys(rng, n, 10000)
+    c = ExpiringCounter(duration=60)
+
+    def run(lo, hi):
+        put = c.put
+        for i in range(lo, hi):
+            put(keys[i])
+
+    return run
+
+
+@case("expiring_cache.get_put", n=200000)
+def expiring_cache_get_put(rng, n):
+    # A read-through cache smaller than the key space
+    keys = zipf_keys(rng, n, 50000)
+    c = ExpiringCache(5000, default_timeout=60)
+
+    def run(lo, hi):
+        get, put = c.get, c.put
+        for i in range(lo, hi):
+            key = keys[i]
+            if get(key) is None:
+                put(key, key)
+
+    return run
+
+
+@case("memoize.call", n=200000)
+def memoize_call(rng, n):
+    keys = zipf_keys(rng, n, 50000)
+
+    @memoize
+    def fn(key):
+        return key.upper()
+
+    def run(lo, hi):
+        for i in range(lo, hi):
+            fn(keys[i])
+
+    return run
+
+
+@case("attrdict.deep_read", n=100000)
+def attrdict_deep_read(rng, n):
+    depth, fanout = 6, 4
+    cfg = AttrDict(nested_dict(rng, depth, fanout))
+    paths = [["k%d" % rng.randrange(fanout) for _ in range(depth)] for _ in range(n)]
+    read = functools.partial(functools.reduce, getattr)
+
+    def run(lo, hi):
+        for i in range(lo, hi):
+            read(paths[i], cfg)
+
+    return run
+
+
+@case("iter_as_file.read", n=4096, batch=16)
+def iter_as_file_read(rng, n):
+    # 1MB chunks read 64KB at a time, 256MB at scale 1
+    chunk = bytes(rng.getrandbits(8) for _ in range(1024)) * 1024
+    f = IterAsFile(chunk for _ in range(n // 16 + 1))
+
+    def run(lo, hi):
+        read = f.read
+        for _ in range(lo, hi):
+            read(65536)
+
+    return run
+
+
+@case("iter_as_file.small_read", n=200000)
+def iter_as_file_small_read(rng, n):
+    # 100 byte reads from 4MB chunks, where copying the rest of a
+    # chunk on every read would make this quadratic
+    chunk = bytes(rng.getrandbits(8) for _ in range(1024)) * 4096
+    f = IterAsFile(chunk for _ in range(n * 100 // len(chunk) + 1))
+
+    def run(lo, hi):
+        read = f.read
+        for _ in range(lo, hi):
+            read(100)
+
+    return run
+
+
+@case("iter_as_file.readline", n=200000)
+def iter_as_file_readline(rng, n):
+    # Short lines, both inside 4MB chunks and across 7 byte ones
+    line = b"%09d\n" % rng.randrange(10**9)
+    big = line * (4 * 1024 * 1024 // len(line))
+    small = [big[i : i + 7] for i in range(0, 70000, 7)]
+    chunks = itertools.repeat(big, n * len(line) // len(big) + 1)
+    f = IterAsFile(itertools.chain(small, chunks))
+
+    def run(lo, hi):
+        readline = f.readline
+        for _ in range(lo, hi):
+            readline()
+
+    return run
+
+
+def percentile(quantiles, p):
+    return quantiles[p - 1] if quantiles else 0.0
+
+
+def measure(make, n, batch, seed, repeat):
+    """
+    Returns the throughput, latency percentiles in us and peak memory
+    of a case, the best of @repeat timed runs
+    """
+    clock = time.perf_counter
+    best = None
+    for _ in range(repeat):
+        run = make(random.Random(seed), n)
+        latencies = []
+        start = clock()
+        for lo in range(0, n, batch):
+            hi = min(lo + batch, n)
+            t = clock()
+            run(lo, hi)
+            latencies.append((clock() - t) / (hi - lo))
+        elapsed = clock() - start
+        if best is None or elapsed < best[0]:
+            best = (elapsed, latencies)
+
+    elapsed, latencies = best
+    quantiles = statistics.quantiles(latencies, n=100) if len(latencies) > 1 else []
+
+    # The workload is built before tracing, so only what the
+    # structure itself allocates counts
+    run = make(random.Random(seed), n)
+    tracemalloc.start()
+    try:
+        run(0, n)
+        peak = tracemalloc.get_traced_memory()[1]
+    finally:
+        tracemalloc.stop()
+
+    return dict(
+        ops=n,
+        ops_per_sec=n / elapsed,
+        p50_us=percentile(quantiles, 50) * 1e6,
+        p95_us=percentile(quantiles, 95) * 1e6,
+        p99_us=percentile(quantiles, 99) * 1e6,
+        peak_bytes=peak,
+    )
+
+
+def regressions(result, base, threshold):
+    found = []
+    if result["ops_per_sec"] < base["ops_per_sec"] * (1 - threshold):
+        found.append("throughput")
+
+    grown = result["peak_bytes"] - base["peak_bytes"]
+    if grown > MIN_MEMORY_DELTA and grown > base["peak_bytes"] * threshold:
+        found.append("memory")
+
+    return found
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--only", help="comma separated substrings of case names")
+    parser.add_argument("--scale", type=float, default=1.0, help="workload size")
+    parser.add_argument("--repeat", type=int, default=3, help="timed runs per case")
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--save", metavar="PATH", help="save results as a baseline")
+    parser.add_argument("--compare", metavar="PATH", help="baseline to compare to")
+    parser.add_argument(
+        "--threshold",
+        type=float,
+        default=0.2,
+        help="allowed throughput drop or memory growth, as a fraction",
+    )
+    args = parser.parse_args()
+
+    names = list(CASES)
+    if args.only:
+        only = args.only.split(",")
+        names = [name for name in names if any(o in name for o in only)]
+
+    baseline = {}
+    if args.compare:
+        with open(args.compare) as f:
+            baseline = json.load(f)
+        if baseline.get("scale") != args.scale:
+            print("warning: baseline was run with --scale %s" % baseline.get("scale"))
+        baseline = baseline["results"]
+
+    header = "%-28s %12s %9s %9s %9s %10s" % (
+        "case",
+        "ops/s",
+        "p50 us",
+        "p95 us",
+        "p99 us",
+        "peak KB",
+    )
+    print(header + ("  vs baseline" if baseline else ""))
+
+    results, failed = {}, []
+    for name in names:
+        make, n, batch = CASES[name]
+        n = max(batch * 2, int(n * args.scale))
+        r = results[name] = measure(make, n, batch, args.seed, args.repeat)
+
+        line = "%-28s %12.0f %9.2f %9.2f %9.2f %10.1f" % (
+            name,
+            r["ops_per_sec"],
+            r["p50_us"],
+            r["p95_us"],
+            r["p99_us"],
+            r["peak_bytes"] / 1024.0,
+        )
+
+        base = baseline.get(name)
+        if base:
+            speed = r["ops_per_sec"] / base["ops_per_sec"] - 1
+            line += "  %+6.1f%% ops/s" % (speed * 100)
+            found = regressions(r, base, args.threshold)
+            if found:
+                failed.append(name)
+                line += "  REGRESSED (%s)" % ", ".join(found)
+        print(line)
+
+    if args.save:
+        with open(args.save, "w") as f:
+            json.dump(
+                dict(
+                    python=platform.python_version(),
+                    machine=platform.machine(),
+                    scale=args.scale,
+                    seed=args.seed,
+                    results=results,
+                ),
+                f,
+                indent=2,
+                sort_keys=True,
+            )
+
+    if failed:
+        print("%d case(s) regressed: %s" % (len(failed), ", ".join(failed)))
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
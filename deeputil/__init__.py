@@ -1,19 +1,112 @@
-from .keep_running import keeprunning
+"""
+Submodules and the names below are only imported on first use, so
+that `import deeputil` stays cheap for tools that need a helper or two.
 
-from .streamcounter import StreamCounter
+>>> import subprocess, sys
+>>> code = (
+...     "import sys, deeputil; deeputil.AttrDict; "
+...     "print(sorted(m for m in sys.modules if m.startswith('deeputil')), "
+...     "[m for m in ('asyncio', 'concurrent.futures', 'repoze.lru', 'inspect') "
+...     "if m in sys.modules])"
+... )
+>>> print(subprocess.check_output([sys.executable, "-c", code]).decode().strip())
+['deeputil', 'deeputil.misc', 'deeputil.priority_dict'] []
+"""
 
-from .timer import FunctionTimer
-from .timer import BlockTimer
+import sys
+import importlib
 
-from . import misc
-from .misc import generate_random_string
-from .misc import get_timestamp, get_datetime, convert_ts
-from .misc import xcode, parse_location
-from .misc import ExpiringCache, ExpiringCounter
-from .misc import deepgetattr, AttrDict
-from .misc import IterAsFile, set_file_limits
-from .misc import Dummy
-from .misc import memoize, load_object
-from .misc import grouper
+# Public name -> submodule it is defined in
+_EXPORTS = dict(
+    keeprunning="keep_running",
+    StreamCounter="streamcounter",
+    DecayedStreamCounter="streamcounter",
+    StreamDistinctCounter="streamcounter",
+    HyperLogLog="hyperloglog",
+    FunctionTimer="timer",
+    BlockTimer="timer",
+    Profile="timer",
+    generate_random_string="misc",
+    generate_random_strings="misc",
+    RandomStrings="misc",
+    get_timestamp="misc",
+    get_datetime="misc",
+    convert_ts="misc",
+    get_timestamps="misc",
+    get_datetimes="misc",
+    convert_ts_many="misc",
+    xcode="misc",
+    xcode_iter="misc",
+    decode_iter="misc",
+    transcode_iter="misc",
+    parse_location="misc",
+    Location="misc",
+    get_location="misc",
+    get_locations="misc",
+    ExpiringCache="expiring_cache",
+    ExpiringCounter="misc",
+    deepgetattr="misc",
+    deepgetter="misc",
+    deepgetters="misc",
+    AttrDict="misc",
+    AttrDictView="misc",
+    FrozenAttrDict="misc",
+    IterAsFile="misc",
+    IterAsRawIO="misc",
+    set_file_limits="misc",
+    Dummy="misc",
+    memoize="misc",
+    load_object="misc",
+    preload_objects="misc",
+    clear_object_cache="misc",
+    grouper="misc",
+    adaptive_grouper="misc",
+    async_adaptive_grouper="misc",
+    batched_map="misc",
+    LineReader="misc",
+    PriorityDict="priority_dict",
+    ConnectionPool="connection_pool",
+    MemoryBudget="membudget",
+    MetricsRegistry="metrics",
+    Pipeline="pipeline",
+)
 
-from .priority_dict import PriorityDict
+_SUBMODULES = (
+    "keep_running",
+    "streamcounter",
+    "hyperloglog",
+    "timer",
+    "misc",
+    "expiring_cache",
+    "priority_dict",
+    "connection_pool",
+    "membudget",
+    "metrics",
+    "pipeline",
+)
+
+__all__ = sorted(_EXPORTS) + list(_SUBMODULES)
+
+
+def __getattr__(name):
+    if name in _EXPORTS:
+        module = importlib.import_module("." + _EXPORTS[name], __name__)
+        value = getattr(module, name)
+    elif name in _SUBMODULES:
+        value = importlib.import_module("." + name, __name__)
+    else:
+        raise AttributeError("module %r has no attribute %r" % (__name__, name))
+
+    # Later lookups find it directly without coming back here
+    globals()[name] = value
+    return value
+
+
+def __dir__():
+    return sorted(set(globals()) | set(__all__))
+
+
+if sys.version_info < (3, 7):
+    # No module level __getattr__ (PEP 562), import everything upfront
+    for _name in __all__:
+        __getattr__(_name)
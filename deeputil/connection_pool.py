@@ -0,0 +1,268 @@
+"""Reuses connections to the locations parsed by misc.get_location"""
+
+import time
+import threading
+import collections
+from contextlib import contextmanager
+
+from .misc import Location, get_location
+
+
+class ConnectionPoolTimeout(Exception):
+    pass
+
+
+def _close(conn):
+    conn.close()
+
+
+class ConnectionPool(object):
+    """
+    A thread-safe pool of connections, kept per Location.
+
+    @connect(location) opens a new connection. At most @max_per_host
+    connections are open per location; when all are busy, getting one
+    waits until another thread gives one back. Idle connections expire
+    after @idle_timeout seconds and, when @check is given, are only
+    handed out again if check(conn) is true. Expired connections to
+    every location are closed as connections are acquired and released,
+    or by `reap`.
+
+    >>> import socket
+    >>> server = socket.socket()
+    >>> server.bind(('127.0.0.1', 0))
+    >>> server.listen(16)
+    >>> loc = 'tcp://127.0.0.1:%d' % server.getsockname()[1]
+
+    >>> def connect(loc):
+    ...     return socket.create_connection((loc.host, loc.port))
+    ...
+    >>> pool = ConnectionPool(connect, max_per_host=1,
+    ...                       check=lambda conn: conn.fileno() != -1)
+    >>> with pool.get(loc) as c1:
+    ...     list(pool.stats().values())
+    [{'in_use': 1, 'idle': 0}]
+    >>> with pool.get(loc) as c2:
+    ...     pass
+    >>> c1 is c2
+    True
+
+    >>> c = pool.acquire(loc)
+    >>> pool.acquire(loc, timeout=0.1)
+    Traceback (most recent call last):
+    ...
+    deeputil.connection_pool.ConnectionPoolTimeout: no connection to 127.0.0.1 in 0.1s
+    >>> pool.release(loc, c)
+
+    A connection whose block raised is closed rather than reused
+
+    >>> with pool.get(loc) as c3:
+    ...     raise IOError('reset')
+    Traceback (most recent call last):
+    ...
+    OSError: reset
+    >>> c3.fileno()
+    -1
+    >>> pool.close()
+
+    >>> pool = ConnectionPool(connect, idle_timeout=0.05)
+    >>> with pool.get(loc) as c4:
+    ...     pass
+    >>> time.sleep(0.1)
+    >>> pool.reap(), pool.stats(), c4.fileno()
+    (1, {}, -1)
+    >>> server.close()
+    """
+
+    DEFAULT_MAX_PER_HOST = 10
+    DEFAULT_IDLE_TIMEOUT = 60  # seconds
+
+    def __init__(
+        self,
+        connect,
+        default_port=None,
+        max_per_host=DEFAULT_MAX_PER_HOST,
+        idle_timeout=DEFAULT_IDLE_TIMEOUT,
+        check=None,
+        close=_close,
+    ):
+        self.connect = connect
+        self.default_port = default_port
+        self.max_per_host = max_per_host
+        self.idle_timeout = idle_timeout
+        self.check = check
+        self.close_conn = close
+
+        # Shared by all locations, so waiters are woken with notify_all
+        self._cond = threading.Condition()
+        # Idle connections per location, as (expires, conn),
+        # most recently used last
+        self._idle = {}
+        # Number of open connections per location, idle or not
+        self._nconns = collections.Counter()
+        # When all locations are next swept for expired connections
+        self._next_reap = time.monotonic() + idle_timeout
+
+    def _location(self, loc):
+        if isinstance(loc, Location):
+            return loc
+        return get_location(loc, self.default_port)
+
+    def _take_idle(self, loc, now, expired):
+        idle = self._idle.get(loc)
+        if not idle:
+            return None
+
+        while idle and idle[0][0] <= now:
+            expired.append(idle.popleft()[1])
+            self._nconns[loc] -= 1
+
+        return idle.pop()[1] if idle else None
+
+    def _reap_all(self, now, expired):
+        # Sweeps every location now and then, so connections to
+        # locations not asked for again are closed too
+        if now < self._next_reap:
+            return
+        self._next_reap = now + self.idle_timeout / 4.0
+
+        for loc, idle in list(self._idle.items()):
+            while idle and idle[0][0] <= now:
+                expired.append(idle.popleft()[1])
+                self._nconns[loc] -= 1
+
+            if not idle:
+                del self._idle[loc]
+                if not self._nconns[loc]:
+                    del self._nconns[loc]
+
+    def reap(self):
+        """
+        Closes the idle connections that expired, returns how many
+        """
+        expired = []
+        with self._cond:
+            self._next_reap = 0
+            self._reap_all(time.monotonic(), expired)
+        self._discard(expired)
+        return len(expired)
+
+    def _discard(self, conns):
+        for conn in conns:
+            try:
+                self.close_conn(conn)
+            except Exception:
+                pass
+
+    def acquire(self, loc, timeout=None):
+        """
+        Returns a connection to @loc, waiting up to @timeout seconds
+        (forever if None) when @max_per_host are already in use.
+        It must be given back with `release`.
+        """
+        loc = self._location(loc)
+        deadline = None if timeout is None else time.monotonic() + timeout
+
+        while True:
+            expired = []
+            conn = None
+            new = False
+            with self._cond:
+                self._reap_all(time.monotonic(), expired)
+                while True:
+                    conn = self._take_idle(loc, time.monotonic(), expired)
+                    if conn is not None:
+                        break
+
+                    if self._nconns[loc] < self.max_per_host:
+                        self._nconns[loc] += 1
+                        new = True
+                        break
+
+                    wait = None if deadline is None else deadline - time.monotonic()
+                    if wait is not None and wait <= 0:
+                        break
+                    self._cond.wait(wait)
+
+            self._discard(expired)
+
+            if conn is None and not new:
+                raise ConnectionPoolTimeout(
+                    "no connection to %s in %ss" % (loc.host, timeout)
+                )
+
+            if new:
+                try:
+                    return self.connect(loc)
+                except BaseException:
+                    self._forget(loc)
+                    raise
+
+            if self.check is None or self.check(conn):
+                return conn
+
+            # Failed its health check, close it and try again
+            self._discard([conn])
+            self._forget(loc)
+
+    def _forget(self, loc):
+        with self._cond:
+            self._nconns[loc] -= 1
+            self._cond.notify_all()
+
+    def release(self, loc, conn, discard=False):
+        """
+        Gives @conn back to the pool, or closes it if @discard
+        """
+        loc = self._location(loc)
+        if discard:
+            self._discard([conn])
+            self._forget(loc)
+            return
+
+        now = time.monotonic()
+        expired = []
+        with self._cond:
+            idle = self._idle.get(loc)
+            if idle is None:
+                idle = self._idle[loc] = collections.deque()
+            idle.append((now + self.idle_timeout, conn))
+            self._reap_all(now, expired)
+            self._cond.notify_all()
+        self._discard(expired)
+
+    @contextmanager
+    def get(self, loc, timeout=None):
+        """
+        with pool.get(loc) as conn: ...
+        The connection is closed instead of reused if the block raises.
+        """
+        loc = self._location(loc)
+        conn = self.acquire(loc, timeout)
+        try:
+            yield conn
+        except BaseException:
+            self.release(loc, conn, discard=True)
+            raise
+        else:
+            self.release(loc, conn)
+
+    def stats(self):
+        with self._cond:
+            stats = {}
+            for loc, n in self._nconns.items():
+                nidle = len(self._idle.get(loc, ()))
+                stats[loc] = dict(in_use=n - nidle, idle=nidle)
+            return stats
+
+    def close(self):
+        """
+        Closes all idle connections
+        """
+        with self._cond:
+            conns = []
+            for loc, idle in self._idle.items():
+                self._nconns[loc] -= len(idle)
+                conns.extend(conn for _, conn in idle)
+            self._idle = {}
+        self._discard(conns)
@@ -0,0 +1,79 @@
+"""ExpiringCache, kept apart from misc so that importing misc does not load repoze.lru"""
+
+import time
+import heapq
+import itertools
+
+from repoze.lru import ExpiringLRUCache
+
+from . import metrics
+
+
+class ExpiringCache(ExpiringLRUCache):
+    """
+    Return value for key. If not in cache or expired, return default
+
+    >>> c = ExpiringCache(10, default_timeout=1)
+    >>> c.put('a', 100)
+    >>> c.get('a')
+    100
+    >>> time.sleep(1)
+    >>> c.get('a')
+    """
+
+    # A MemoryBudget this cache is registered with
+    memory_budget = None
+
+    def put(self, key, val, timeout=None):
+        ExpiringLRUCache.put(self, key, val, timeout)
+
+        budget = self.memory_budget
+        if budget is not None:
+            budget.tick(self)
+
+    def get(self, key, default=None):
+        self.lookups += 1
+        try:
+            pos, val, expires = self.data[key]
+        except KeyError:
+            self.misses += 1
+            if metrics.registry is not None:
+                metrics.registry.inc("deeputil_cache_misses_total")
+
+            return default
+        if expires > time.time():
+            # cache entry still valid
+            self.hits += 1
+            if metrics.registry is not None:
+                metrics.registry.inc("deeputil_cache_hits_total")
+            # Not updating clock_refs to disable
+            # LRU logic as we just want expiry without LRU
+            # self.clock_refs[pos] = True
+
+            return val
+        else:
+            # cache entry has expired. Make sure the space in the cache can
+            # be recycled soon.
+            self.misses += 1
+            self.clock_refs[pos] = False
+            if metrics.registry is not None:
+                metrics.registry.inc("deeputil_cache_misses_total")
+
+            return default
+
+    def _mem_entries(self):
+        return len(self.data)
+
+    def _mem_sample(self, n):
+        with self.lock:
+            return [(k, v[1]) for k, v in itertools.islice(self.data.items(), n)]
+
+    def _mem_evict(self, fraction):
+        # The entries closest to expiring go first
+        with self.lock:
+            n = int(len(self.data) * fraction)
+            expiring = heapq.nsmallest(n, self.data.items(), key=lambda kv: kv[1][2])
+
+        for key, _ in expiring:
+            self.invalidate(key)
+        self.evictions += len(expiring)
@@ -0,0 +1,128 @@
+"""Estimates the number of distinct items in a stream in fixed memory"""
+
+import math
+import hashlib
+
+# 2 ** -rank for every possible register value
+_POWERS = [2.0**-r for r in range(65)]
+
+
+def _hash64(item):
+    # The type goes into the hash, so that 1 and '1' differ
+    if isinstance(item, str):
+        data, person = item.encode("utf-8"), b"str"
+    elif isinstance(item, (bytes, bytearray)):
+        data, person = item, b"bytes"
+    else:
+        t = type(item)
+        data = ("%s.%s:%r" % (t.__module__, t.__qualname__, item)).encode("utf-8")
+        person = b"repr"
+
+    digest = hashlib.blake2b(data, digest_size=8, person=person).digest()
+    return int.from_bytes(digest, "big")
+
+
+class HyperLogLog(object):
+    """
+    A HyperLogLog sketch of 2 ** @p one byte registers (4KB for the
+    default p=12), estimating how many distinct items were added with
+    a standard error of about 1.04 / sqrt(2 ** p), ie: 1.6% for p=12.
+    Sketches of the same @p can be merged, giving the estimate for
+    the union of what was added to either.
+
+    Items are str, bytes or values such as numbers and tuples whose
+    repr identifies them: other objects, with the default repr, are
+    told apart by their memory address. Items of different types
+    count as different, even with the same repr.
+
+    >>> h = HyperLogLog()
+    >>> for i in range(100000):
+    ...     h.add(i % 20000)
+    >>> abs(h.estimate() - 20000) < 20000 * 0.05
+    True
+
+    >>> a, b = HyperLogLog(10), HyperLogLog(10)
+    >>> for i in range(5000):
+    ...     a.add('user-%d' % i)
+    ...     b.add('user-%d' % (i + 2500))
+    >>> abs(len(a | b) - 7500) < 7500 * 0.1
+    True
+    >>> h = HyperLogLog(4)
+    >>> len(h)
+    0
+    >>> h.add('x')
+    >>> len(h)
+    1
+    >>> a | HyperLogLog(12)
+    Traceback (most recent call last):
+    ...
+    ValueError: cannot merge sketches with p=10 and p=12
+
+    >>> h = HyperLogLog()
+    >>> for item in (1, '1', b'1', 1.0):
+    ...     h.add(item)
+    >>> len(h)
+    4
+    """
+
+    DEFAULT_P = 12
+
+    def __init__(self, p=DEFAULT_P):
+        if not 4 <= p <= 16:
+            raise ValueError("p must be between 4 and 16")
+
+        self.p = p
+        self.m = 1 << p
+        self.registers = bytearray(self.m)
+
+        # Bits of the hash left after taking p of them for the index
+        self._bits = 64 - p
+        self._mask = (1 << self._bits) - 1
+
+    def add(self, item):
+        x = _hash64(item)
+        w = x & self._mask
+        # Position of the first 1 bit, counting from the left
+        rank = self._bits - w.bit_length() + 1
+
+        idx = x >> self._bits
+        if rank > self.registers[idx]:
+            self.registers[idx] = rank
+
+    def merge(self, other):
+        """
+        Adds everything counted by @other into this sketch
+        """
+        if other.p != self.p:
+            raise ValueError(
+                "cannot merge sketches with p=%d and p=%d" % (self.p, other.p)
+            )
+        self.registers = bytearray(map(max, self.registers, other.registers))
+        return self
+
+    def copy(self):
+        h = HyperLogLog(self.p)
+        h.registers = bytearray(self.registers)
+        return h
+
+    def __or__(self, other):
+        return self.copy().merge(other)
+
+    def estimate(self):
+        m = self.m
+        if m >= 128:
+            alpha = 0.7213 / (1 + 1.079 / m)
+        else:
+            alpha = {16: 0.673, 32: 0.697, 64: 0.709}[m]
+
+        e = alpha * m * m / sum(map(_POWERS.__getitem__, self.registers))
+
+        zeros = self.registers.count(0)
+        if e <= 2.5 * m and zeros:
+            # Few items, linear counting is more accurate
+            e = m * math.log(m / float(zeros))
+
+        return e
+
+    def __len__(self):
+        return int(round(self.estimate()))
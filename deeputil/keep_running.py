@@ -1,8 +1,6 @@
-"""Keeps running a function running even on error
-"""
+"""Keeps running a function running even on error"""
 
 import time
-import inspect
 
 
 class KeepRunningTerminate(Exception):
@@ -138,6 +136,8 @@ def keeprunning(
     """
 
     def decfn(fn):
+        import inspect
+
         def _call_callback(cb, fargs):
             if not cb:
                 return
@@ -0,0 +1,240 @@
+"""Limits how much memory deeputil's caches and counters hold, together"""
+
+import os
+import sys
+import threading
+import weakref
+
+
+def get_rss():
+    """
+    Returns the resident set size of this process in bytes, or None
+    where /proc/self/statm is not available
+
+    >>> get_rss() > 0
+    True
+    """
+    try:
+        with open("/proc/self/statm") as f:
+            pages = int(f.read().split()[1])
+    except (IOError, OSError, IndexError, ValueError):
+        return None
+
+    return pages * os.sysconf("SC_PAGE_SIZE")
+
+
+_CONTAINERS = (tuple, list, dict, set, frozenset)
+
+
+def _sizeof(obj):
+    size = sys.getsizeof(obj)
+    if isinstance(obj, dict):
+        for k, v in obj.items():
+            size += sys.getsizeof(k) + sys.getsizeof(v)
+    elif isinstance(obj, _CONTAINERS):
+        for v in obj:
+            size += sys.getsizeof(v)
+
+    return size
+
+
+def _entry_size(entry):
+    key, value = entry
+    # Plus about what a dict spends per entry
+    return _sizeof(key) + _sizeof(value) + 48
+
+
+class MemoryBudget(object):
+    """
+    A memory budget shared by the structures registered with it:
+    ExpiringCache, memoized functions, StreamCounter, DecayedStreamCounter
+    and ExpiringCounter.
+
+    Every @check_every insertions into any of them, their sizes are
+    estimated from their number of entries and the size of a sample of
+    @sample_size entries. When that total goes over @max_bytes, or the
+    process RSS over @max_rss, every structure evicts the same fraction of
+    its entries, in its own order: soonest to expire for ExpiringCache,
+    oldest for memoize, oldest chunks for StreamCounter, smallest counts
+    for DecayedStreamCounter and oldest buckets for ExpiringCounter.
+    Eviction goes down to @low_water times the limit.
+
+    None of these structures is locked, so a structure is only ever
+    evicted from by the thread inserting into it: when a check finds
+    the budget exceeded, each structure evicts its share on its own
+    next insertion. A structure shared between threads must be locked
+    by its users anyway, and that lock then covers eviction too.
+
+    >>> from deeputil.misc import memoize
+    >>> budget = MemoryBudget(max_bytes=100000, check_every=100)
+    >>> @memoize
+    ... def square(x):
+    ...     return [x] * 10
+    >>> budget.register(square, name='square')
+    >>> for i in range(2000):
+    ...     _ = square(i)
+    >>> budget.n_evictions > 0, budget.usage()['square']['entries'] < 2000
+    (True, True)
+    >>> _ = budget.enforce(evict=True)
+    >>> budget.total() <= 100000
+    True
+    >>> budget.unregister(square)
+    >>> budget.usage()
+    {}
+    """
+
+    DEFAULT_CHECK_EVERY = 10000
+    DEFAULT_SAMPLE_SIZE = 32
+    DEFAULT_LOW_WATER = 0.9
+    # At most this much of every structure is evicted at once, as some
+    # of the RSS may not be theirs
+    MAX_EVICT_FRACTION = 0.5
+
+    def __init__(
+        self,
+        max_bytes=None,
+        max_rss=None,
+        check_every=DEFAULT_CHECK_EVERY,
+        sample_size=DEFAULT_SAMPLE_SIZE,
+        low_water=DEFAULT_LOW_WATER,
+    ):
+        self.max_bytes = max_bytes
+        self.max_rss = max_rss
+        self.check_every = check_every
+        self.sample_size = sample_size
+        self.low_water = low_water
+
+        # name: weakref to a registered structure
+        self._members = {}
+        # id of a registered structure: fraction it has yet to evict
+        self._pending = {}
+        self._lock = threading.Lock()
+        self._countdown = check_every
+
+        # Times eviction was triggered
+        self.n_evictions = 0
+
+    def register(self, obj, name=None):
+        """
+        Makes @obj count against this budget. Memoized functions
+        can be passed as they are.
+        """
+        if not hasattr(obj, "_mem_entries"):
+            # A memoized function, a bound method of its cache
+            obj = obj.__self__
+
+        if name is None:
+            name = "%s@%x" % (type(obj).__name__, id(obj))
+
+        members = self._members
+        pending = self._pending
+
+        def forget(ref, name=name, key=id(obj)):
+            pending.pop(key, None)
+            if members.get(name) is ref:
+                del members[name]
+
+        members[name] = weakref.ref(obj, forget)
+        obj.memory_budget = self
+
+    def unregister(self, obj):
+        if not hasattr(obj, "_mem_entries"):
+            obj = obj.__self__
+
+        for name, ref in list(self._members.items()):
+            if ref() is obj:
+                del self._members[name]
+        self._pending.pop(id(obj), None)
+        obj.memory_budget = None
+
+    def _live(self):
+        for name, ref in list(self._members.items()):
+            obj = ref()
+            if obj is not None:
+                yield name, obj
+
+    def tick(self, obj):
+        """
+        Called by the registered structure @obj on every insertion,
+        from the thread inserting into it
+        """
+        if self._pending:
+            fraction = self._pending.pop(id(obj), None)
+            if fraction:
+                obj._mem_evict(fraction)
+
+        self._countdown -= 1
+        if self._countdown <= 0:
+            self._countdown = self.check_every
+            self.enforce()
+
+    def usage(self):
+        """
+        Returns {name: {'entries': n, 'bytes': approximate size}}
+        for every registered structure
+        """
+        usage = {}
+        for name, obj in self._live():
+            n = obj._mem_entries()
+            sample = []
+            for _ in range(3):
+                try:
+                    sample = obj._mem_sample(self.sample_size)
+                    break
+                except RuntimeError:
+                    # Changed size while sampled by another thread
+                    pass
+            size = 0
+            if sample:
+                size = n * sum(map(_entry_size, sample)) // len(sample)
+            usage[name] = dict(entries=n, bytes=size)
+
+        return usage
+
+    def total(self):
+        return sum(u["bytes"] for u in self.usage().values())
+
+    def enforce(self, evict=False):
+        """
+        Has every registered structure evict on its next insertion if
+        over the limits, or right away with @evict, which is only safe
+        when no other thread is using them. Returns the fraction of
+        entries to evict.
+        """
+        if not self._lock.acquire(False):
+            # Another thread is at it already
+            return 0.0
+
+        try:
+            total = self.total()
+            if not total:
+                return 0.0
+
+            excess = 0
+            if self.max_bytes is not None and total > self.max_bytes:
+                excess = total - self.max_bytes * self.low_water
+
+            rss = get_rss() if self.max_rss is not None else None
+            if rss is not None and rss > self.max_rss:
+                excess = max(excess, rss - self.max_rss * self.low_water)
+
+            if excess <= 0:
+                return 0.0
+
+            fraction = min(self.MAX_EVICT_FRACTION, excess / float(total))
+            pending = self._pending
+            for _, obj in self._live():
+                if evict:
+                    obj._mem_evict(fraction)
+                else:
+                    pending[id(obj)] = max(pending.get(id(obj), 0.0), fraction)
+            self.n_evictions += 1
+
+            return fraction
+        finally:
+            self._lock.release()
+
+
+# Budget for the whole process, without limits until they are set, eg:
+# default_budget.max_rss = 2 * 1024 ** 3
+default_budget = MemoryBudget()
@@ -0,0 +1,310 @@
+"""Collects counters and timings from deeputil's classes in one place"""
+
+import threading
+
+# The registry deeputil's classes report to, None while disabled
+registry = None
+
+
+def enable(new_registry=None):
+    """
+    Makes ExpiringCache, StreamCounter and FunctionTimer report to
+    @new_registry (a new MetricsRegistry if None), which is returned
+    """
+    global registry
+    registry = new_registry or MetricsRegistry()
+    return registry
+
+
+def disable():
+    global registry
+    registry = None
+
+
+def _escape(value):
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def labels(**kw):
+    """
+    Formats labels for MetricsRegistry methods, eg:
+    labels(fn='handler') gives 'fn="handler"'. Building them once, rather
+    than per event, keeps instrumentation cheap.
+
+    >>> print(labels(path='/a"b', code=200))
+    code="200",path="/a\\"b"
+    """
+    return ",".join('%s="%s"' % (k, _escape(v)) for k, v in sorted(kw.items()))
+
+
+class MetricsRegistry(object):
+    """
+    An in-process store of counters, summaries (count and sum of
+    observed values) and gauges.
+
+    Each thread adds to dicts of its own, without locking, which are
+    only merged when scraped. The dicts of threads that ended are folded
+    into one, so short-lived threads don't add up. A metric is a name
+    plus optional labels, formatted with `labels`.
+
+    >>> r = MetricsRegistry()
+    >>> r.inc('jobs_total')
+    >>> t = threading.Thread(target=r.inc, args=('jobs_total', 2))
+    >>> t.start(); t.join()
+    >>> r.observe('job_seconds', 0.25, labels(queue='fast'))
+    >>> r.observe('job_seconds', 0.5, labels(queue='fast'))
+    >>> r.set('queue_length', 7)
+    >>> print(r.prometheus())
+    # TYPE jobs_total counter
+    jobs_total 3
+    # TYPE job_seconds summary
+    job_seconds_count{queue="fast"} 2
+    job_seconds_sum{queue="fast"} 0.75
+    # TYPE queue_length gauge
+    queue_length 7
+    <BLANKLINE>
+    >>> for i in range(200):
+    ...     t = threading.Thread(target=r.inc, args=('jobs_total',))
+    ...     t.start(); t.join()
+    >>> r.counters()[('jobs_total', '')], len(r._threads) < 10
+    (203, True)
+
+    deeputil's own classes report to the registry given to `enable`
+
+    >>> from deeputil.expiring_cache import ExpiringCache
+    >>> r = enable()
+    >>> c = ExpiringCache(10)
+    >>> c.put('a', 1)
+    >>> c.get('a'), c.get('b')
+    (1, None)
+    >>> sorted(r.counters().items())
+    [(('deeputil_cache_hits_total', ''), 1), (('deeputil_cache_misses_total', ''), 1)]
+    >>> disable()
+    """
+
+    def __init__(self):
+        self._local = threading.local()
+        # (thread, (counters, summaries)) of every live thread that
+        # reported, and the merged (counters, summaries) of ended ones
+        self._threads = []
+        self._ended = ({}, {})
+        self._threads_lock = threading.Lock()
+        self._gauges = {}
+
+    def _thread_dicts(self):
+        dicts = self._local.dicts = ({}, {})
+        with self._threads_lock:
+            self._fold_ended()
+            self._threads.append((threading.current_thread(), dicts))
+        return dicts
+
+    def _fold_ended(self):
+        # With _threads_lock held. Ended threads no longer write to
+        # their dicts, so they can be merged without them.
+        ended_counters, ended_summaries = self._ended
+        live = []
+        for thread, dicts in self._threads:
+            if thread.is_alive():
+                live.append((thread, dicts))
+                continue
+
+            counters, summaries = dicts
+            for key, value in counters.items():
+                ended_counters[key] = ended_counters.get(key, 0) + value
+            for key, (n, total) in summaries.items():
+                s = ended_summaries.get(key)
+                if s is None:
+                    ended_summaries[key] = [n, total]
+                else:
+                    s[0] += n
+                    s[1] += total
+
+        self._threads = live
+
+    def inc(self, name, value=1, labels=""):
+        try:
+            counters = self._local.dicts[0]
+        except AttributeError:
+            counters = self._thread_dicts()[0]
+
+        key = (name, labels)
+        counters[key] = counters.get(key, 0) + value
+
+    def observe(self, name, value, labels=""):
+        try:
+            summaries = self._local.dicts[1]
+        except AttributeError:
+            summaries = self._thread_dicts()[1]
+
+        key = (name, labels)
+        s = summaries.get(key)
+        if s is None:
+            summaries[key] = [1, value]
+        else:
+            s[0] += 1
+            s[1] += value
+
+    def set(self, name, value, labels=""):
+        self._gauges[(name, labels)] = value
+
+    def _all_threads(self):
+        with self._threads_lock:
+            self._fold_ended()
+            return [dicts for _, dicts in self._threads] + [self._ended]
+
+    def counters(self):
+        """
+        Returns {(name, labels): total} over all threads
+        """
+        merged = {}
+        for counters, _ in self._all_threads():
+            for key, value in counters.copy().items():
+                merged[key] = merged.get(key, 0) + value
+        return merged
+
+    def summaries(self):
+        """
+        Returns {(name, labels): (count, sum)} over all threads
+        """
+        merged = {}
+        for _, summaries in self._all_threads():
+            for key, (n, total) in summaries.copy().items():
+                mn, mtotal = merged.get(key, (0, 0))
+                merged[key] = (mn + n, mtotal + total)
+        return merged
+
+    def gauges(self):
+        return self._gauges.copy()
+
+    def prometheus(self):
+        """
+        Returns all metrics in the Prometheus text exposition format
+        """
+        lines = []
+
+        def add(kind, metrics, suffixes):
+            typed = set()
+            for (name, labels), value in sorted(metrics.items()):
+                if name not in typed:
+                    typed.add(name)
+                    lines.append("# TYPE %s %s" % (name, kind))
+                labels = "{%s}" % labels if labels else ""
+                values = value if suffixes != ("",) else (value,)
+                for suffix, v in zip(suffixes, values):
+                    lines.append("%s%s%s %s" % (name, suffix, labels, v))
+
+        add("counter", self.counters(), ("",))
+        add("summary", self.summaries(), ("_count", "_sum"))
+        add("gauge", self.gauges(), ("",))
+
+        return "\n".join(lines) + "\n"
+
+
+class StatsdExporter(object):
+    """
+    Sends the metrics of @registry over UDP to a statsd agent at
+    @host:@port, as changes since the last send: counters and the
+    count and sum (in ms) of summaries as counters, gauges as gauges.
+    Labels become DogStatsD style tags.
+
+    >>> import socket
+    >>> agent = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+    >>> agent.bind(('127.0.0.1', 0))
+    >>> r = MetricsRegistry()
+    >>> e = StatsdExporter(r, port=agent.getsockname()[1])
+    >>> r.inc('jobs_total', 3)
+    >>> r.observe('job_seconds', 0.25, labels(queue='fast'))
+    >>> e.send()
+    >>> print(agent.recv(65536).decode())
+    deeputil.jobs_total:3|c
+    deeputil.job_seconds.count:1|c|#queue:fast
+    deeputil.job_seconds.sum:250.0|c|#queue:fast
+    >>> r.inc('jobs_total')
+    >>> e.send()
+    >>> print(agent.recv(65536).decode())
+    deeputil.jobs_total:1|c
+    >>> e.close(); agent.close()
+    """
+
+    # Kept under the usual MTU so datagrams are not fragmented
+    MAX_PACKET = 1400
+
+    def __init__(self, registry, host="127.0.0.1", port=8125, prefix="deeputil."):
+        import socket
+
+        self.registry = registry
+        self.address = (host, port)
+        self.prefix = prefix
+        self.sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+
+        # What was sent so far, to send only what changed
+        self._sent = {}
+        self._thread = None
+        self._stop = threading.Event()
+
+    def _tags(self, labels):
+        if not labels:
+            return ""
+        tags = []
+        for label in labels.split('",'):
+            k, _, v = label.partition('="')
+            tags.append("%s:%s" % (k, v.rstrip('"')))
+        return "|#" + ",".join(tags)
+
+    def _delta(self, key, value):
+        delta = value - self._sent.get(key, 0)
+        self._sent[key] = value
+        return delta
+
+    def lines(self):
+        prefix = self.prefix
+        for (name, labels), value in sorted(self.registry.counters().items()):
+            delta = self._delta((name, labels), value)
+            if delta:
+                yield "%s%s:%s|c%s" % (prefix, name, delta, self._tags(labels))
+
+        for (name, labels), (n, total) in sorted(self.registry.summaries().items()):
+            dn = self._delta((name + ".count", labels), n)
+            dtotal = self._delta((name + ".sum", labels), total)
+            if dn:
+                tags = self._tags(labels)
+                yield "%s%s.count:%s|c%s" % (prefix, name, dn, tags)
+                yield "%s%s.sum:%s|c%s" % (prefix, name, dtotal * 1000, tags)
+
+        for (name, labels), value in sorted(self.registry.gauges().items()):
+            yield "%s%s:%s|g%s" % (prefix, name, value, self._tags(labels))
+
+    def send(self):
+        packet = []
+        size = 0
+        for line in self.lines():
+            if packet and size + len(line) + 1 > self.MAX_PACKET:
+                self.sock.sendto("\n".join(packet).encode(), self.address)
+                packet, size = [], 0
+            packet.append(line)
+            size += len(line) + 1
+
+        if packet:
+            self.sock.sendto("\n".join(packet).encode(), self.address)
+
+    def start(self, interval=10):
+        """
+        Sends every @interval seconds from a daemon thread
+        """
+
+        def run():
+            while not self._stop.wait(interval):
+                try:
+                    self.send()
+                except (IOError, OSError):
+                    pass
+
+        self._thread = threading.Thread(target=run, name="statsd-exporter")
+        self._thread.daemon = True
+        self._thread.start()
+
+    def close(self):
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join()
+        self.sock.close()
@@ -0,0 +1,276 @@
+"""Chains LineReader, batched_map, grouper and IterAsRawIO into streaming pipelines"""
+
+import io
+import time
+import queue
+import itertools
+import threading
+
+from .misc import IterAsRawIO, LineReader, batched_map, decode_iter, grouper
+
+_DONE = object()
+
+
+class _Error(object):
+    # An exception raised by a stage, passed on to the consumer
+    __slots__ = ("exc",)
+
+    def __init__(self, exc):
+        self.exc = exc
+
+
+class _Stage(object):
+    def __init__(self, name, fn):
+        self.name = name
+        self.fn = fn
+        self.items = 0
+        self.started = None
+        self.finished = None
+
+    def counted(self, it):
+        self.started = time.time()
+        try:
+            for item in it:
+                self.items += 1
+                yield item
+        finally:
+            self.finished = time.time()
+
+    def stats(self):
+        seconds = 0.0
+        if self.started is not None:
+            seconds = (self.finished or time.time()) - self.started
+        rate = self.items / seconds if seconds else 0.0
+        return dict(name=self.name, items=self.items, seconds=seconds, rate=rate)
+
+
+def _read_chunks(f, chunk_size):
+    fobj = open(f, "rb") if isinstance(f, str) else f
+    try:
+        read = fobj.read
+        while True:
+            chunk = read(chunk_size)
+            if not chunk:
+                return
+            yield chunk
+    finally:
+        if fobj is not f:
+            fobj.close()
+
+
+class Pipeline(object):
+    """
+    A chain of stages over an iterator, each stage taking the iterator
+    of the one before. Everything is lazy, so a file of any size goes
+    through in constant memory.
+
+    With @queue_size, every stage runs in a thread of its own and hands
+    its output over in batches of up to QUEUE_BATCH items through a
+    queue of @queue_size batches, so that reading, parsing and
+    processing overlap while a slow stage holds back the ones before it.
+    Exceptions in any stage are raised to the consumer.
+
+    >>> import io, json
+    >>> data = b''.join(b'{"id": %d}\\n' % i for i in range(10))
+    >>> p = (Pipeline.from_file(io.BytesIO(data), chunk_size=16)
+    ...      .lines(keepends=False)
+    ...      .map(json.loads, workers=2, batch_size=4)
+    ...      .map(lambda doc: doc['id'])
+    ...      .batch(4))
+    >>> list(p)
+    [(0, 1, 2, 3), (4, 5, 6, 7), (8, 9)]
+    >>> [(s['name'], s['items']) for s in p.stats()]
+    [('read', 7), ('lines', 10), ('map', 10), ('map', 10), ('batch', 3)]
+
+    >>> p = Pipeline(range(1000), queue_size=4).filter(lambda x: x % 2)
+    >>> sum(p.map(lambda x: x * 10, name='scale'))
+    2500000
+
+    >>> list(Pipeline(['1', 'x'], queue_size=2).map(int))
+    Traceback (most recent call last):
+    ...
+    ValueError: invalid literal for int() with base 10: 'x'
+
+    Stage threads stop when the output is dropped before its end
+
+    >>> before = threading.active_count()
+    >>> it = iter(Pipeline(itertools.count(), queue_size=2).map(str))
+    >>> next(it)
+    '0'
+    >>> it.close()
+    >>> time.sleep(0.5)
+    >>> threading.active_count() == before
+    True
+
+    `as_file` reads the output as a binary file, eg: for gzip, csv or
+    an upload API
+
+    >>> f = Pipeline([b'a,1\\n', b'b,2\\n']).map(bytes.upper).as_file()
+    >>> f.readline(), f.read()
+    (b'A,1\\n', b'B,2\\n')
+    >>> Pipeline(['caf', 'é']).as_file(encoding='utf8').read()
+    b'caf\\xc3\\xa9'
+    """
+
+    DEFAULT_CHUNK_SIZE = 1024 * 1024
+    QUEUE_BATCH = 256
+
+    def __init__(self, source=(), queue_size=None):
+        self.source = source
+        self.queue_size = queue_size
+        self.stages = []
+        self._stop = threading.Event()
+
+    @classmethod
+    def from_file(cls, f, chunk_size=DEFAULT_CHUNK_SIZE, queue_size=None):
+        """
+        A pipeline reading the binary file or path @f in chunks
+        of @chunk_size bytes
+        """
+        p = cls(queue_size=queue_size)
+        return p.stage(lambda _: _read_chunks(f, chunk_size), name="read")
+
+    def stage(self, fn, name=None):
+        """
+        Adds fn(iterator) -> iterator as the next stage
+        """
+        self.stages.append(_Stage(name or getattr(fn, "__name__", "stage"), fn))
+        return self
+
+    def decode(self, encoding="utf8", mode="strict"):
+        """
+        Decodes bytes chunks into str, see `decode_iter`
+        """
+        return self.stage(lambda it: decode_iter(it, encoding, mode), name="decode")
+
+    def lines(self, linesep=None, keepends=True, max_line_length=None):
+        """
+        Splits chunks into lines with `LineReader`
+        """
+        return self.stage(
+            lambda it: LineReader(it, linesep, keepends, max_line_length), name="lines"
+        )
+
+    def map(
+        self,
+        fn,
+        workers=None,
+        executor="thread",
+        batch_size=1000,
+        ordered=True,
+        name="map",
+    ):
+        """
+        Applies @fn to every item. With @workers, or an @executor that is
+        not "thread", this runs in a pool on batches, see `batched_map`.
+        """
+        if workers is None and executor == "thread":
+            return self.stage(lambda it: map(fn, it), name=name)
+
+        return self.stage(
+            lambda it: batched_map(
+                fn, it, batch_size, workers, executor=executor, ordered=ordered
+            ),
+            name=name,
+        )
+
+    def filter(self, fn, name="filter"):
+        return self.stage(lambda it: filter(fn, it), name=name)
+
+    def batch(self, n, name="batch"):
+        """
+        Groups items into tuples of @n, see `grouper`
+        """
+        return self.stage(lambda it: grouper(n, it), name=name)
+
+    def _put(self, q, item):
+        while True:
+            try:
+                q.put(item, timeout=0.1)
+                return True
+            except queue.Full:
+                if self._stop.is_set():
+                    return False
+
+    def _pump(self, it, q):
+        try:
+            while True:
+                batch = list(itertools.islice(it, self.QUEUE_BATCH))
+                if not batch:
+                    break
+                if not self._put(q, batch):
+                    return
+            item = _DONE
+        except BaseException as e:
+            item = _Error(e)
+        self._put(q, item)
+
+    def _threaded(self, it):
+        q = queue.Queue(self.queue_size)
+        t = threading.Thread(target=self._pump, args=(it, q))
+        t.daemon = True
+        t.start()
+
+        def drain():
+            try:
+                while True:
+                    batch = q.get()
+                    if batch is _DONE:
+                        return
+                    if isinstance(batch, _Error):
+                        self._stop.set()
+                        raise batch.exc
+                    for item in batch:
+                        yield item
+            except GeneratorExit:
+                # Closed, or collected, before its end
+                self._stop.set()
+                raise
+
+        return drain()
+
+    def __iter__(self):
+        self._stop.clear()
+        it = iter(self.source)
+        for stage in self.stages:
+            it = stage.counted(stage.fn(it))
+            if self.queue_size:
+                it = self._threaded(it)
+        return it
+
+    def close(self):
+        """
+        Stops the stage threads of a pipeline that was not read to the end
+        """
+        self._stop.set()
+
+    def run(self):
+        """
+        Runs the pipeline to the end, returns `stats`
+        """
+        for _ in self:
+            pass
+        return self.stats()
+
+    def as_file(self, buffer_size=io.DEFAULT_BUFFER_SIZE, encoding=None):
+        """
+        Returns a buffered binary file reading the output, which must be
+        bytes, or str encoded with @encoding. See `IterAsRawIO`.
+        """
+        return IterAsRawIO.buffered(iter(self), buffer_size, encoding=encoding)
+
+    def write(self, f):
+        """
+        Writes every item, str or bytes, to the file @f and returns `stats`
+        """
+        write = f.write
+        for item in self:
+            write(item)
+        return self.stats()
+
+    def stats(self):
+        """
+        Returns the number of items each stage produced, the seconds
+        since it started and its rate in items per second
+        """
+        return [stage.stats() for stage in self.stages]
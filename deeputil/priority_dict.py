@@ -26,7 +26,10 @@ For more information, please refer to <http://unlicense.org/>
 By Matteo Dell'Amico
 """
 
+import pickle
 from heapq import heapify, heappush, heappop
+from itertools import compress
+from operator import itemgetter
 
 
 class PriorityDict(dict):
@@ -136,3 +139,78 @@ class PriorityDict(dict):
 
         while self:
             yield self.pop_smallest()
+
+    def _live(self, entries):
+        # 1 for the heap entries that are current, 0 for stale ones
+        get = dict.get
+        return bytes(get(self, k, _MISSING) == v for v, k in entries)
+
+    def _extend_heap(self, entries, live):
+        # Adds heap entries as they are, and the live ones to the dict
+        self._heap.extend(entries)
+        dict.update(self, map(_swap, compress(entries, live)))
+
+    def __reduce__(self):
+        return (_from_heap, (type(self), self._heap, self._live(self._heap)))
+
+    DUMP_BATCH_SIZE = 65536
+
+    def dump(self, f, batch_size=DUMP_BATCH_SIZE):
+        """Write the dictionary to the binary file @f, to be read back
+        with `PriorityDict.load`.
+
+        The heap is written as it is, in pickled batches of @batch_size
+        entries, each flagged as live or stale. Loading it then needs no
+        heapify, and neither needs much more memory than one batch.
+
+        >>> import io
+        >>> x = PriorityDict({'id1': 22, 'id2': 13, 'id3': 29})
+        >>> x['id1'] = 5
+        >>> f = io.BytesIO()
+        >>> x.dump(f, batch_size=2)
+        >>> _ = f.seek(0)
+        >>> y = PriorityDict.load(f)
+        >>> y == x, y._heap == x._heap
+        (True, True)
+        >>> list(y.sorted_iter())
+        ['id1', 'id2', 'id3']
+
+        Pickling works the same way, in one go
+
+        >>> import pickle
+        >>> z = pickle.loads(pickle.dumps(x))
+        >>> z == x, z._heap == x._heap
+        (True, True)
+        """
+
+        heap = self._heap
+        pickle.dump((1, len(heap)), f, pickle.HIGHEST_PROTOCOL)
+        for i in range(0, len(heap), batch_size):
+            entries = heap[i : i + batch_size]
+            pickle.dump((entries, self._live(entries)), f, pickle.HIGHEST_PROTOCOL)
+
+    @classmethod
+    def load(cls, f):
+        """Read a dictionary written by `dump` from the binary file @f.
+        Only load files from trusted sources, as they are unpickled.
+        """
+
+        version, n = pickle.load(f)
+        if version != 1:
+            raise ValueError("unknown PriorityDict dump version %r" % version)
+
+        d = cls()
+        while len(d._heap) < n:
+            d._extend_heap(*pickle.load(f))
+
+        return d
+
+
+_MISSING = object()
+_swap = itemgetter(1, 0)
+
+
+def _from_heap(cls, heap, live):
+    d = cls()
+    d._extend_heap(heap, live)
+    return d
@@ -1,10 +1,31 @@
+import heapq
+import itertools
 from collections import Counter
+from operator import itemgetter
+
+from . import metrics
+from .hyperloglog import HyperLogLog
 
 
 class StreamCounter(object):
     """
     A class whose responsibility is to get the count of items
     in data comming as a stream.
+
+    With @distinct_p, a HyperLogLog sketch of 2 ** distinct_p bytes is
+    also kept per chunk and dropped along with it, and `distinct`
+    estimates the number of distinct items in the chunks kept.
+    `StreamDistinctCounter` does the same without the counts, in a few
+    KB whatever the number of distinct items.
+
+    >>> s = StreamCounter(chunk_size=1000, max_counts=10000, distinct_p=10)
+    >>> for i in range(3000):
+    ...     s.add(i % 1500)
+    >>> abs(s.distinct() - 1500) < 1500 * 0.1
+    True
+    >>> s._drop_oldest_chunk()
+    >>> sorted(s.chunked_sketches)
+    [1, 2]
     """
 
     # TODO Doctests and examples
@@ -16,10 +37,23 @@ class StreamCounter(object):
     # Max count will be maximum occurence of an item
     DEFAULT_MAX_COUNTS = 1000000
 
-    def __init__(self, chunk_size=DEFAULT_CHUNK_SIZE, max_counts=DEFAULT_MAX_COUNTS):
+    # A MemoryBudget this counter is registered with
+    memory_budget = None
+
+    def __init__(
+        self,
+        chunk_size=DEFAULT_CHUNK_SIZE,
+        max_counts=DEFAULT_MAX_COUNTS,
+        distinct_p=None,
+    ):
 
         self.chunk_size = chunk_size
         self.max_counts = max_counts
+        self.distinct_p = distinct_p
+
+        # HyperLogLog sketches of the items in every chunk, keyed by
+        # chunk id, when distinct_p is given
+        self.chunked_sketches = None if distinct_p is None else {}
 
         # Counts of items stored on a per chunk basis
         # Dict of dictionaries. Outer dict has chunk id as key
@@ -82,6 +116,8 @@ class StreamCounter(object):
         """
         self.n_items_seen += count
         self.n_chunk_items_seen += count
+        if metrics.registry is not None:
+            metrics.registry.inc("deeputil_stream_items_total", count)
 
         # get current chunk
         chunk_id = self.n_chunks
@@ -95,6 +131,16 @@ class StreamCounter(object):
             self.n_counts += 1
             chunk[item] = count
 
+        self.counts[item] += count
+        self.counts_total += count
+
+        sketches = self.chunked_sketches
+        if sketches is not None:
+            sketch = sketches.get(chunk_id)
+            if sketch is None:
+                sketch = sketches[chunk_id] = HyperLogLog(self.distinct_p)
+            sketch.add(item)
+
         # is the current chunk done?
         if self.n_chunk_items_seen >= self.chunk_size:
             self.n_chunks += 1
@@ -105,6 +151,10 @@ class StreamCounter(object):
         while self.n_counts >= self.max_counts:
             self._drop_oldest_chunk()
 
+        budget = self.memory_budget
+        if budget is not None:
+            budget.tick(self)
+
     def _drop_oldest_chunk(self):
         """
         To handle the case when the items comming in the chunk
@@ -126,15 +176,39 @@ class StreamCounter(object):
         2
         >>> s.chunked_counts
         {2: {'f': 1}}
+        >>> s.counts
+        Counter({'f': 1})
         """
         chunk_id = min(self.chunked_counts.keys())
         chunk = self.chunked_counts.pop(chunk_id)
+        if self.chunked_sketches is not None:
+            self.chunked_sketches.pop(chunk_id, None)
 
         self.n_counts -= len(chunk)
-        for k, v in list(chunk.items()):
-            self.counts[k] -= v
+        counts = self.counts
+        for k, v in chunk.items():
+            c = counts[k] - v
+            if c:
+                counts[k] = c
+            else:
+                del counts[k]
             self.counts_total -= v
 
+    def _mem_entries(self):
+        return self.n_counts
+
+    def _mem_sample(self, n):
+        if not self.chunked_counts:
+            return []
+        chunk = self.chunked_counts[max(self.chunked_counts)]
+        return list(itertools.islice(chunk.items(), n))
+
+    def _mem_evict(self, fraction):
+        # The oldest chunks go first
+        target = self.n_counts * (1 - fraction)
+        while self.chunked_counts and self.n_counts > target:
+            self._drop_oldest_chunk()
+
     def get(self, item, default=0, normalized=False):
         """
         When we have the stream of data pushed in the chunk
@@ -175,3 +249,276 @@ class StreamCounter(object):
 
     def __getitem__(self, k):
         return self.get(k)
+
+    def distinct(self):
+        """
+        Estimates the number of distinct items in the chunks kept,
+        needs @distinct_p
+        """
+        if self.chunked_sketches is None:
+            raise ValueError("distinct needs a StreamCounter with distinct_p")
+
+        merged = HyperLogLog(self.distinct_p)
+        for sketch in self.chunked_sketches.values():
+            merged.merge(sketch)
+        return merged.estimate()
+
+
+class DecayedStreamCounter(object):
+    """
+    Counts items like StreamCounter, with the same `add` and `get`, but
+    counts fade out smoothly instead of being dropped a chunk at a
+    time: an item counted @half_life items ago weighs half as much as
+    one counted just now. There are no chunks, so it is not a subclass.
+
+    Counts are stored multiplied by a scale factor that grows as items
+    arrive, so adding an item only touches its own count. Once in a while
+    every count is divided back by that factor, and the ones that decayed
+    below @min_count are pruned, as are the smallest ones when more than
+    @max_counts items are tracked.
+
+    >>> s = DecayedStreamCounter(half_life=10)
+    >>> for item in 'a' * 10 + 'b' * 10:
+    ...     s.add(item)
+    >>> round(s.get('a'), 2), round(s.get('b'), 2)
+    (3.73, 7.47)
+    >>> round(s.get('a', normalized=True), 2)
+    0.33
+    >>> for item in 'b' * 10:
+    ...     s.add(item)
+    >>> round(s['a'], 2), round(s.counts_total, 2)
+    (1.87, 13.07)
+    >>> s.get('z')
+    0
+
+    >>> s = DecayedStreamCounter(half_life=1, max_counts=100)
+    >>> for i in range(1000):
+    ...     s.add(i)
+    >>> len(s.counts) <= 100, [k for k, _ in s.most_common(2)]
+    (True, [999, 998])
+
+    A count of many half-lives at once decays the others right away
+
+    >>> s = DecayedStreamCounter(half_life=10)
+    >>> s.add('x', count=20000)
+    >>> s.add('y', count=20000)
+    >>> s.get('x'), s.get('y')
+    (0, 20000.0)
+    """
+
+    DEFAULT_HALF_LIFE = 100000
+    DEFAULT_MIN_COUNT = 0.01
+    # Counts are renormalized before the scale factor grows past
+    # 2 ** MAX_SCALE_EXPONENT
+    MAX_SCALE_EXPONENT = 64
+    MAX_SCALE = 2.0**MAX_SCALE_EXPONENT
+
+    # A MemoryBudget this counter is registered with
+    memory_budget = None
+
+    def __init__(
+        self,
+        half_life=DEFAULT_HALF_LIFE,
+        max_counts=StreamCounter.DEFAULT_MAX_COUNTS,
+        min_count=DEFAULT_MIN_COUNT,
+    ):
+        self.half_life = half_life
+        self.max_counts = max_counts
+        self.min_count = min_count
+
+        # Growth of the scale factor per item
+        self._step = 2.0 ** (1.0 / half_life)
+        self.scale = 1.0
+
+        # Counts and their total, multiplied by self.scale
+        self._counts = {}
+        self._total = 0.0
+
+        # Total items seen so far
+        self.n_items_seen = 0
+
+    @property
+    def counts(self):
+        scale = self.scale
+        return {k: v / scale for k, v in self._counts.items()}
+
+    @property
+    def counts_total(self):
+        return self._total / self.scale
+
+    def add(self, item, count=1):
+        self.n_items_seen += count
+        if metrics.registry is not None:
+            metrics.registry.inc("deeputil_stream_items_total", count)
+
+        if count == 1:
+            step = self._step
+        else:
+            exponent = count / float(self.half_life)
+            if exponent > self.MAX_SCALE_EXPONENT:
+                # step would overflow, so decay the other counts now
+                self._renormalize(2.0**-exponent)
+                step = 1.0
+            else:
+                step = 2.0**exponent
+        self.scale = scale = self.scale * step
+
+        weight = count * scale
+        counts = self._counts
+        counts[item] = counts.get(item, 0.0) + weight
+        self._total += weight
+
+        if scale > self.MAX_SCALE or len(counts) > self.max_counts:
+            self._renormalize()
+
+        budget = self.memory_budget
+        if budget is not None:
+            budget.tick(self)
+
+    def _renormalize(self, decay=1.0):
+        # Also multiplies every count by @decay
+        factor = decay / self.scale
+        min_count = self.min_count
+        counts = {}
+        for k, v in self._counts.items():
+            v *= factor
+            if v >= min_count:
+                counts[k] = v
+
+        if len(counts) > self.max_counts:
+            # Keep the largest, leaving room for a quarter as many new items
+            keep = self.max_counts * 3 // 4
+            counts = dict(heapq.nlargest(keep, counts.items(), key=itemgetter(1)))
+
+        self._counts = counts
+        self._total = float(sum(counts.values()))
+        self.scale = 1.0
+
+    def _mem_entries(self):
+        return len(self._counts)
+
+    def _mem_sample(self, n):
+        return list(itertools.islice(self._counts.items(), n))
+
+    def _mem_evict(self, fraction):
+        # The smallest counts go first
+        keep = int(len(self._counts) * (1 - fraction))
+        self._counts = dict(
+            heapq.nlargest(keep, self._counts.items(), key=itemgetter(1))
+        )
+        self._total = float(sum(self._counts.values()))
+
+    def get(self, item, default=0, normalized=False):
+        c = self._counts.get(item)
+        if c is None:
+            return default
+
+        if normalized:
+            return c / self._total
+
+        return c / self.scale
+
+    def most_common(self, n=None):
+        """
+        Returns the @n items with the largest decayed counts, as
+        (item, count) pairs
+        """
+        scale = self.scale
+        if n is None:
+            items = sorted(self._counts.items(), key=itemgetter(1), reverse=True)
+        else:
+            items = heapq.nlargest(n, self._counts.items(), key=itemgetter(1))
+
+        return [(k, v / scale) for k, v in items]
+
+    def __getitem__(self, k):
+        return self.get(k)
+
+
+class StreamDistinctCounter(object):
+    """
+    Estimates how many distinct items were seen in the last
+    @max_chunks chunks of @chunk_size items of a stream, using one
+    HyperLogLog sketch (of 2 ** @p bytes) per chunk instead of keeping
+    the items themselves. Like StreamCounter's chunks, the oldest sketch
+    is dropped as a new chunk starts once @max_chunks are kept.
+
+    >>> s = StreamDistinctCounter(chunk_size=1000, max_chunks=3, p=10)
+    >>> for i in range(3000):
+    ...     s.add('10.0.%d.%d' % (i // 256, i % 256))
+    >>> abs(s.estimate() - 3000) < 3000 * 0.1
+    True
+    >>> for i in range(2000):
+    ...     s.add('10.0.0.1')
+    >>> sorted(s.chunked_sketches), abs(s.estimate() - 1001) < 1001 * 0.1
+    ([2, 3, 4], True)
+    """
+
+    DEFAULT_CHUNK_SIZE = StreamCounter.DEFAULT_CHUNK_SIZE
+    DEFAULT_MAX_CHUNKS = 10
+
+    def __init__(
+        self,
+        chunk_size=DEFAULT_CHUNK_SIZE,
+        max_chunks=DEFAULT_MAX_CHUNKS,
+        p=HyperLogLog.DEFAULT_P,
+    ):
+        self.chunk_size = chunk_size
+        self.max_chunks = max_chunks
+        self.p = p
+
+        # One sketch per chunk, keyed by chunk id
+        self.chunked_sketches = {}
+
+        # Total chunks seen so far
+        self.n_chunks = 0
+
+        # Total items seen so far
+        self.n_items_seen = 0
+
+        # Total items seen in current chunk
+        self.n_chunk_items_seen = 0
+
+        # Union of the completed chunks in the window, built when
+        # first needed and dropped when a chunk leaves the window
+        self._merged = None
+
+    def add(self, item):
+        sketch = self.chunked_sketches.get(self.n_chunks)
+        if sketch is None:
+            # A new chunk starts
+            sketch = self.chunked_sketches[self.n_chunks] = HyperLogLog(self.p)
+            while len(self.chunked_sketches) > self.max_chunks:
+                self._drop_oldest_chunk()
+
+        sketch.add(item)
+        self.n_items_seen += 1
+        self.n_chunk_items_seen += 1
+
+        # is the current chunk done?
+        if self.n_chunk_items_seen >= self.chunk_size:
+            if self._merged is not None:
+                self._merged.merge(sketch)
+            self.n_chunks += 1
+            self.n_chunk_items_seen = 0
+
+    def _drop_oldest_chunk(self):
+        del self.chunked_sketches[min(self.chunked_sketches)]
+        self._merged = None
+
+    def estimate(self):
+        if self._merged is None:
+            merged = HyperLogLog(self.p)
+            for chunk_id, sketch in self.chunked_sketches.items():
+                if chunk_id < self.n_chunks:
+                    merged.merge(sketch)
+            self._merged = merged
+
+        current = self.chunked_sketches.get(self.n_chunks)
+        if current is None:
+            return self._merged.estimate()
+
+        return (self._merged | current).estimate()
+
+    def __len__(self):
+        return int(round(self.estimate()))
@@ -1,11 +1,57 @@
 import time
+import threading
+
+from . import metrics
+
+try:
+    import contextvars
+except ImportError:  # Python < 3.7
+    contextvars = None
+
+# On-CPU time of the calling thread, excluding time spent sleeping
+# or waiting on I/O
+_cpu_clock = getattr(time, "thread_time", time.process_time)
+
+
+class _CPUTimedAwaitable(object):
+    """
+    Awaits @coro, adding up the cpu time of every step it runs
+    on the event loop into self.cpu
+    """
+
+    def __init__(self, coro):
+        self.coro = coro
+        self.cpu = 0.0
+
+    def __await__(self):
+        it = self.coro.__await__()
+        value, exc = None, None
+        while True:
+            cs = _cpu_clock()
+            try:
+                if exc is None:
+                    step = it.send(value)
+                else:
+                    step = it.throw(exc)
+            except StopIteration as e:
+                return e.value
+            finally:
+                self.cpu += _cpu_clock() - cs
+
+            try:
+                value, exc = (yield step), None
+            except GeneratorExit:
+                it.close()
+                raise
+            except BaseException as e:
+                value, exc = None, e
 
 
 class FunctionTimerTerminate(Exception):
     pass
 
 
-def FunctionTimer(on_done=None):
+def FunctionTimer(on_done=None, cpu=False):
     """
     To check execution time of a function
     borrowed from https://medium.com/pythonhive/python-decorator-to-measure-the-execution-time-of-methods-fa04cb6bb36d
@@ -31,19 +77,92 @@ def FunctionTimer(on_done=None):
     foo executing...
     ('foo', 3)
     ('bar', 5)
+
+    Coroutine functions are timed until their result is awaited
+
+    >>> import asyncio
+    >>> @FunctionTimer(on_done=logger)
+    ... async def handler(t):
+    ...     await asyncio.sleep(t)
+    ...
+    >>> asyncio.run(handler(1))
+    ('handler', 1)
+
+    With cpu=True, details are (name, wall seconds, cpu seconds) as
+    floats. For a coroutine, cpu seconds only count the steps it ran
+    on the event loop, so a large value points at a handler that
+    blocks the loop.
+
+    >>> def spin(t):
+    ...     te = time.time() + t
+    ...     while time.time() < te:
+    ...         pass
+    ...
+    >>> def cpu_logger(details, args, kwargs):
+    ...     name, wall, cpu = details
+    ...     print(name, wall > 0.4, 0.05 < cpu < 0.3)
+    ...
+    >>> @FunctionTimer(on_done=cpu_logger, cpu=True)
+    ... async def handler():
+    ...     await asyncio.sleep(0.3)
+    ...     spin(0.1)
+    ...
+    >>> asyncio.run(handler())
+    handler True True
     """
 
     def decfn(fn):
-        def timed(*args, **kwargs):
-            ts = time.time()
-            result = fn(*args, **kwargs)
-            te = time.time()
+        import inspect
+
+        fn_labels = metrics.labels(fn=fn.__qualname__)
+
+        def done(ts, te, cpu_time, args, kwargs):
+            registry = metrics.registry
+            if registry is not None:
+                registry.observe("deeputil_function_seconds", te - ts, fn_labels)
+                if cpu:
+                    registry.observe(
+                        "deeputil_function_cpu_seconds", cpu_time, fn_labels
+                    )
+
             if on_done:
-                on_done((fn.__name__, int(te - ts)), args, kwargs)
+                if cpu:
+                    on_done((fn.__name__, te - ts, cpu_time), args, kwargs)
+                else:
+                    on_done((fn.__name__, int(te - ts)), args, kwargs)
+            elif cpu:
+                msg = "%r  %f sec(s), %f cpu sec(s)"
+                print((msg % (fn.__name__, (te - ts), cpu_time)))
             else:
                 print(("%r  %d sec(s)" % (fn.__name__, (te - ts))))
 
-            return result
+        if inspect.iscoroutinefunction(fn):
+
+            async def timed(*args, **kwargs):
+                ts = time.time()
+                if cpu:
+                    coro = _CPUTimedAwaitable(fn(*args, **kwargs))
+                    result = await coro
+                    cpu_time = coro.cpu
+                else:
+                    result = await fn(*args, **kwargs)
+                    cpu_time = None
+                te = time.time()
+                done(ts, te, cpu_time, args, kwargs)
+
+                return result
+
+        else:
+
+            def timed(*args, **kwargs):
+                ts = time.time()
+                cs = _cpu_clock() if cpu else 0.0
+                result = fn(*args, **kwargs)
+                ce = _cpu_clock() if cpu else 0.0
+                te = time.time()
+                done(ts, te, ce - cs, args, kwargs)
+
+                return result
 
         return timed
 
@@ -53,7 +172,206 @@ def FunctionTimer(on_done=None):
 FunctionTimer.terminate = FunctionTimerTerminate
 
 
-class BlockTimer:
+class Span(object):
+    """
+    A node in the call tree built by named `BlockTimer` blocks.
+    Repeated runs of the same path aggregate into the same node.
+
+    inclusive: total seconds spent in the block, children included
+    exclusive: seconds spent in the block itself, children excluded
+    """
+
+    __slots__ = ("name", "parent", "children", "calls", "inclusive")
+
+    def __init__(self, name, parent=None):
+        self.name = name
+        self.parent = parent
+        self.children = {}
+        self.calls = 0
+        self.inclusive = 0.0
+
+    def child(self, name):
+        span = self.children.get(name)
+        if span is None:
+            span = self.children[name] = Span(name, self)
+        return span
+
+    @property
+    def exclusive(self):
+        return self.inclusive - sum(c.inclusive for c in self.children.values())
+
+    def merge(self, other):
+        self.calls += other.calls
+        self.inclusive += other.inclusive
+        # Copied first, @other may belong to a thread adding spans
+        for name, span in list(other.children.items()):
+            self.child(name).merge(span)
+
+    def walk(self, path=()):
+        """
+        Yields (path, span) for every span under this one, hottest first
+        """
+        children = list(self.children.values())
+        children.sort(key=lambda s: s.inclusive, reverse=True)
+        for span in children:
+            spath = path + (span.name,)
+            yield spath, span
+            for x in span.walk(spath):
+                yield x
+
+
+class Profile(object):
+    """
+    Collects the spans of named `BlockTimer` blocks into one call
+    tree per thread.
+
+    >>> ticks = iter([0.0, 1.0, 1.5, 2.0, 2.5, 3.0])
+    >>> p = Profile(clock=lambda: next(ticks))
+    >>> with BlockTimer("ingest", profile=p):
+    ...     for i in range(2):
+    ...         with BlockTimer("parse", profile=p):
+    ...             pass
+    ...
+    >>> print(p.report())
+    name                                       calls       total        self
+    ingest                                         1      3.0000      2.0000
+      parse                                        2      1.0000      1.0000
+    >>> print(p.collapsed())
+    ingest 2000000
+    ingest;parse 1000000
+
+    Concurrent asyncio tasks each nest their blocks under their own
+    spans
+
+    >>> import asyncio
+    >>> p = Profile()
+    >>> async def request(name):
+    ...     async with BlockTimer(name, profile=p):
+    ...         await asyncio.sleep(0.01)
+    ...         async with BlockTimer("db", profile=p):
+    ...             await asyncio.sleep(0.01)
+    ...
+    >>> async def main():
+    ...     await asyncio.gather(request("get"), request("put"))
+    ...
+    >>> asyncio.run(main())
+    >>> sorted(";".join(path) for path, span in p.tree().walk())
+    ['get', 'get;db', 'put', 'put;db']
+
+    Trees of threads that have ended are kept, even when a new thread
+    gets the same ident
+
+    >>> p = Profile()
+    >>> def job():
+    ...     with BlockTimer("job", profile=p):
+    ...         pass
+    ...
+    >>> for i in range(20):
+    ...     t = threading.Thread(target=job)
+    ...     t.start(); t.join()
+    ...
+    >>> [(path, span.calls) for path, span in p.tree().walk()]
+    [(('job',), 20)]
+    """
+
+    def __init__(self, clock=time.perf_counter):
+        self.clock = clock
+        self._lock = threading.Lock()
+        # Root span of every thread that has entered a named block,
+        # keyed by thread ident
+        self._roots = {}
+        # Trees of ended threads whose ident was reused
+        self._ended = Span(None)
+        self._init_current()
+
+    def _init_current(self):
+        self._local = threading.local()
+        # The innermost open span is tracked per asyncio task when
+        # contextvars are available, so interleaved coroutines on one
+        # thread still nest their blocks correctly
+        if contextvars is not None:
+            var = contextvars.ContextVar("deeputil_span", default=None)
+            self._get_current, self._set_current = var.get, var.set
+        else:
+            self._get_current = lambda: getattr(self._local, "current", None)
+            self._set_current = lambda span: setattr(self._local, "current", span)
+
+    def _root(self):
+        try:
+            return self._local.root
+        except AttributeError:
+            thread = threading.current_thread()
+            root = self._local.root = Span(thread.name)
+            with self._lock:
+                ended = self._roots.get(thread.ident)
+                if ended is not None:
+                    # Idents are only reused once a thread has ended
+                    self._ended.merge(ended)
+                self._roots[thread.ident] = root
+            return root
+
+    def enter(self, name):
+        parent = self._get_current() or self._root()
+        span = parent.child(name)
+        self._set_current(span)
+        return span
+
+    def exit(self, span, elapsed):
+        span.calls += 1
+        span.inclusive += elapsed
+        self._set_current(span.parent)
+
+    def tree(self, thread=None):
+        """
+        Returns the root span for @thread (a thread ident, the latest
+        thread with it), or a root merging the trees of all threads,
+        including ended ones, when @thread is None
+        """
+        with self._lock:
+            roots = list(self._roots.items())
+            merged = Span(None)
+            merged.merge(self._ended)
+
+        if thread is not None:
+            return dict(roots).get(thread, Span(None))
+
+        for _, root in roots:
+            merged.merge(root)
+        return merged
+
+    def reset(self):
+        with self._lock:
+            self._roots = {}
+            self._ended = Span(None)
+        self._init_current()
+
+    def report(self, thread=None):
+        lines = ["{:<40}{:>8}{:>12}{:>12}".format("name", "calls", "total", "self")]
+        for path, span in self.tree(thread).walk():
+            name = "  " * (len(path) - 1) + str(span.name)
+            lines.append(
+                "{:<40}{:>8}{:>12.4f}{:>12.4f}".format(
+                    name, span.calls, span.inclusive, span.exclusive
+                )
+            )
+        return "\n".join(lines)
+
+    def collapsed(self, thread=None):
+        """
+        Returns the tree in the collapsed stack format understood by
+        flamegraph.pl, weighted by exclusive microseconds
+        """
+        lines = []
+        for path, span in self.tree(thread).walk():
+            weight = int(round(span.exclusive * 1e6))
+            lines.append("{} {}".format(";".join(map(str, path)), weight))
+        return "\n".join(lines)
+
+
+default_profile = Profile()
+
+
+class BlockTimer(object):
     """
     To check execution time of a code.
     borrowed from:
@@ -64,15 +382,55 @@ class BlockTimer:
     ...
     >>> int(t.interval)
     1
+
+    Named blocks also record a span in @profile (`default_profile`
+    unless given), nested under the enclosing named block of the
+    same thread or asyncio task. See `Profile`.
+
+    It can also be used with `async with`. With cpu=True, the on-CPU
+    time of the thread is kept in cpu_interval. Inside a coroutine
+    that includes other tasks that ran while the block was suspended.
+
+    >>> import asyncio
+    >>> async def handler():
+    ...     async with BlockTimer(cpu=True) as t:
+    ...         await asyncio.sleep(1)
+    ...     return t
+    ...
+    >>> t = asyncio.run(handler())
+    >>> int(t.interval), t.cpu_interval < 0.5
+    (1, True)
     """
 
+    def __init__(self, name=None, profile=None, cpu=False):
+        self.name = name
+        self.profile = profile or default_profile
+        self.cpu = cpu
+        self._span = None
+
     def __enter__(self):
         self.start = time.time()
+        if self.name is not None:
+            self._span = self.profile.enter(self.name)
+        if self.cpu:
+            self._c0 = _cpu_clock()
+        self._t0 = self.profile.clock()
         return self
 
     def __exit__(self, *args):
+        self.interval = self.profile.clock() - self._t0
+        if self.cpu:
+            self.cpu_interval = _cpu_clock() - self._c0
         self.end = time.time()
-        self.interval = self.end - self.start
+        if self._span is not None:
+            self.profile.exit(self._span, self.interval)
+            self._span = None
+
+    async def __aenter__(self):
+        return self.__enter__()
+
+    async def __aexit__(self, *args):
+        return self.__exit__(*args)
 
 
 class Timer(object):
@@ -3,6 +3,7 @@
 import doctest
 import unittest
 
+import deeputil
 from deeputil import *
 
 # suite = doctest.DocTestSuite(deeputil)
@@ -10,17 +11,31 @@ from deeputil import *
 
 def suite_maker():
     suite = unittest.TestSuite()
+    suite.addTests(doctest.DocTestSuite(deeputil))
     suite.addTests(doctest.DocTestSuite(keep_running))
     suite.addTests(doctest.DocTestSuite(misc))
+    suite.addTests(doctest.DocTestSuite(expiring_cache))
     suite.addTests(doctest.DocTestSuite(priority_dict))
     suite.addTests(doctest.DocTestSuite(timer))
-    # suite.addTests(doctest.DocTestSuite(streamcounter))
+    suite.addTests(doctest.DocTestSuite(connection_pool))
+    suite.addTests(doctest.DocTestSuite(membudget))
+    suite.addTests(doctest.DocTestSuite(metrics))
+    suite.addTests(doctest.DocTestSuite(pipeline))
+    suite.addTests(doctest.DocTestSuite(streamcounter))
+    suite.addTests(doctest.DocTestSuite(hyperloglog))
     return suite
 
 
 if __name__ == "__main__":
+    doctest.testmod(deeputil)
     doctest.testmod(keep_running)
     doctest.testmod(misc, optionflags=doctest.ELLIPSIS)
-    # doctest.testmod(streamcounter)
+    doctest.testmod(expiring_cache)
+    doctest.testmod(streamcounter)
+    doctest.testmod(hyperloglog)
     doctest.testmod(timer)
     doctest.testmod(priority_dict)
+    doctest.testmod(connection_pool)
+    doctest.testmod(membudget)
+    doctest.testmod(metrics)
+    doctest.testmod(pipeline)